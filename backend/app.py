@@ -11,6 +11,9 @@ import numpy as np
 from datetime import datetime
 import os
 
+from conditions import ConditionsCache, FileConditionsProvider, OpenMeteoProvider, planned_start
+from forest_inference import DEFAULT_QUANTILES, ForestInference
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Flutter app
 
@@ -31,6 +34,87 @@ else:
     location_encodings = {}
     print("Location encodings not found. Creating new encodings.")
 
+# Load feature names and precompute per-tree arrays for fast inference
+FEATURE_INFO_PATH = 'model/feature_info.pkl'
+if os.path.exists(FEATURE_INFO_PATH):
+    feature_info = joblib.load(FEATURE_INFO_PATH)
+else:
+    feature_info = {}
+    print(f"Feature info not found at {FEATURE_INFO_PATH}.")
+
+forest = ForestInference(model, feature_info.get('feature_names')) if model is not None else None
+
+# Shared forecast cache; a local forecast file replaces the live provider
+CONDITIONS_PATH = os.environ.get('CONDITIONS_PATH', 'data/conditions.json')
+if os.path.exists(CONDITIONS_PATH):
+    conditions = ConditionsCache(FileConditionsProvider(CONDITIONS_PATH))
+    print(f"Conditions loaded from {CONDITIONS_PATH}")
+else:
+    conditions = ConditionsCache(OpenMeteoProvider())
+
+def build_features(data):
+    """Encode a suitability request into the model's feature vector"""
+    # Extract features from request
+    group_size = data.get('group_size', 1)
+    min_age = data.get('min_age', 30)
+    max_age = data.get('max_age', 50)
+    n_fully_mobile = data.get('n_fully_mobile', group_size)
+    n_assisted = data.get('n_assisted', 0)
+    n_wheelchair_user = data.get('n_wheelchair_user', 0)
+    n_limited_endurance = data.get('n_limited_endurance', 0)
+    n_child_carried = data.get('n_child_carried', 0)
+    has_wheelchair_user = n_wheelchair_user > 0
+    
+    location_type = data.get('location_type', 'cultural')
+    terrain_level = data.get('terrain_level', 'flat')
+    accessibility = data.get('accessibility', 'full')
+    heat_exposure_level = data.get('heat_exposure_level', 'medium')
+    preferred_visit_start = data.get('preferred_visit_start', '08:00')
+    best_time_window = data.get('best_time_window', 'Morning')
+    
+    # Encode categorical features
+    terrain_encoded = {'flat': 0, 'mild_elevation': 1, 'hilly': 2, 'steep': 3, 'mixed': 4}.get(terrain_level, 0)
+    accessibility_encoded = {'full': 0, 'partial': 1, 'limited': 2}.get(accessibility, 0)
+    heat_encoded = {'low': 0, 'medium': 1, 'high': 2}.get(heat_exposure_level, 1)
+    location_type_encoded = {'nature': 0, 'religious': 1, 'cultural': 2, 'shopping': 3}.get(location_type, 2)
+    
+    time_window_encoded = {'Morning': 0, 'Midday': 1, 'Afternoon': 2, 'Evening': 3}.get(best_time_window, 1)
+    
+    # Parse time to cyclical encoding (sin/cos)
+    start_hour, start_min = map(int, preferred_visit_start.split(':'))
+    start_time_total_min = start_hour * 60 + start_min
+    start_time_sin = np.sin(2 * np.pi * start_time_total_min / 1440)
+    start_time_cos = np.cos(2 * np.pi * start_time_total_min / 1440)
+    
+    # Feature vector (in order of training)
+    return [
+        group_size,
+        min_age,
+        max_age,
+        n_fully_mobile,
+        n_assisted,
+        n_wheelchair_user,
+        n_limited_endurance,
+        n_child_carried,
+        1 if has_wheelchair_user else 0,
+        terrain_encoded,
+        accessibility_encoded,
+        heat_encoded,
+        location_type_encoded,
+        time_window_encoded,
+        start_time_sin,
+        start_time_cos,
+    ]
+
+def apply_conditions(items):
+    """Derive heat exposure from forecast conditions at each planned start"""
+    levels = conditions.heat_exposures(
+        [item.get('region') for item in items],
+        [planned_start(item.get('visit_date'), item.get('preferred_visit_start', '08:00')) for item in items],
+        [item.get('heat_exposure_level', 'medium') for item in items]
+    )
+    return [dict(item, heat_exposure_level=level) for item, level in zip(items, levels)]
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -39,96 +123,165 @@ def health_check():
         'model_loaded': model is not None
     })
 
+def suitability_response(data, prediction):
+    """Combine a forest prediction with the duration recommendation"""
+    group_size = data.get('group_size', 1)
+    has_wheelchair_user = data.get('n_wheelchair_user', 0) > 0
+    location_type = data.get('location_type', 'cultural')
+    terrain_level = data.get('terrain_level', 'flat')
+    
+    # Calculate recommended duration (in minutes)
+    base_duration = 60
+    if terrain_level in ['hilly', 'steep']:
+        base_duration += 20
+    if location_type == 'cultural':
+        base_duration += 30
+    if group_size >= 5:
+        base_duration += 15
+    if has_wheelchair_user:
+        base_duration += 20
+    
+    # Adjust based on predicted suitability
+    if not prediction['is_suitable']:
+        base_duration = int(base_duration * 0.8)
+    
+    return {
+        'suitability_score': prediction['suitability_score'],
+        'is_suitable': prediction['is_suitable'],
+        'recommended_duration_min': int(base_duration),
+        'best_time_window': data.get('best_time_window', 'Morning'),
+        'heat_exposure_level': data.get('heat_exposure_level', 'medium'),
+        'confidence': prediction['confidence'],
+        'score_std': prediction['score_std'],
+        'score_quantiles': prediction['score_quantiles']
+    }
+
 @app.route('/api/predict/suitability', methods=['POST'])
 def predict_suitability():
     """Predict location suitability for a group"""
     try:
         data = request.json
         
-        if model is None:
+        if forest is None:
             return jsonify({
                 'error': 'Model not loaded. Please train the model first.'
             }), 503
         
-        # Extract features from request
-        group_size = data.get('group_size', 1)
-        min_age = data.get('min_age', 30)
-        max_age = data.get('max_age', 50)
-        n_fully_mobile = data.get('n_fully_mobile', group_size)
-        n_assisted = data.get('n_assisted', 0)
-        n_wheelchair_user = data.get('n_wheelchair_user', 0)
-        n_limited_endurance = data.get('n_limited_endurance', 0)
-        n_child_carried = data.get('n_child_carried', 0)
-        has_wheelchair_user = n_wheelchair_user > 0
-        
-        location_name = data.get('location_name', '')
-        location_type = data.get('location_type', 'cultural')
-        terrain_level = data.get('terrain_level', 'flat')
-        accessibility = data.get('accessibility', 'full')
-        heat_exposure_level = data.get('heat_exposure_level', 'medium')
-        preferred_visit_start = data.get('preferred_visit_start', '08:00')
-        preferred_visit_end = data.get('preferred_visit_end', '17:00')
-        best_time_window = data.get('best_time_window', 'Morning')
-        
-        # Encode categorical features
-        terrain_encoded = {'flat': 0, 'mild_elevation': 1, 'hilly': 2, 'steep': 3, 'mixed': 4}.get(terrain_level, 0)
-        accessibility_encoded = {'full': 0, 'partial': 1, 'limited': 2}.get(accessibility, 0)
-        heat_encoded = {'low': 0, 'medium': 1, 'high': 2}.get(heat_exposure_level, 1)
-        location_type_encoded = {'nature': 0, 'religious': 1, 'cultural': 2, 'shopping': 3}.get(location_type, 2)
-        
-        time_window_encoded = {'Morning': 0, 'Midday': 1, 'Afternoon': 2, 'Evening': 3}.get(best_time_window, 1)
-        
-        # Parse time to cyclical encoding (sin/cos)
-        start_hour, start_min = map(int, preferred_visit_start.split(':'))
-        start_time_total_min = start_hour * 60 + start_min
-        start_time_sin = np.sin(2 * np.pi * start_time_total_min / 1440)
-        start_time_cos = np.cos(2 * np.pi * start_time_total_min / 1440)
-        
-        # Feature vector (in order of training)
-        features = np.array([[
-            group_size,
-            min_age,
-            max_age,
-            n_fully_mobile,
-            n_assisted,
-            n_wheelchair_user,
-            n_limited_endurance,
-            n_child_carried,
-            1 if has_wheelchair_user else 0,
-            terrain_encoded,
-            accessibility_encoded,
-            heat_encoded,
-            location_type_encoded,
-            time_window_encoded,
-            start_time_sin,
-            start_time_cos,
-        ]])
-        
-        # Get prediction
-        suitability_score = float(model.predict(features)[0])
-        is_suitable = suitability_score >= 0.5
-        
-        # Calculate recommended duration (in minutes)
-        base_duration = 60
-        if terrain_level in ['hilly', 'steep']:
-            base_duration += 20
-        if location_type == 'cultural':
-            base_duration += 30
-        if group_size >= 5:
-            base_duration += 15
-        if has_wheelchair_user:
-            base_duration += 20
+        # Per-tree outputs give mean, spread and quantiles in one pass
+        data = apply_conditions([data])[0]
+        features = np.array([build_features(data)])
+        quantiles = data.get('quantiles', DEFAULT_QUANTILES)
+        prediction = forest.predict_records(features, quantiles)[0]
+        
+        return jsonify(suitability_response(data, prediction))
+        
+    except Exception as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+
+@app.route('/api/predict/suitability/batch', methods=['POST'])
+def predict_suitability_batch():
+    """Predict suitability for several locations or groups at once"""
+    try:
+        data = request.json
+        
+        if forest is None:
+            return jsonify({
+                'error': 'Model not loaded. Please train the model first.'
+            }), 503
+        
+        items = data.get('requests', [])
+        if not items:
+            return jsonify({
+                'error': 'No requests provided'
+            }), 400
+        if any('quantiles' in item for item in items):
+            return jsonify({
+                'error': 'quantiles must be set on the batch, not on individual requests'
+            }), 400
+        
+        items = apply_conditions(items)
+        features = np.array([build_features(item) for item in items])
+        quantiles = data.get('quantiles', DEFAULT_QUANTILES)
+        predictions = forest.predict_records(features, quantiles)
+        
+        return jsonify({
+            'predictions': [
+                suitability_response(item, prediction)
+                for item, prediction in zip(items, predictions)
+            ]
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+
+@app.route('/api/predict/suitability/explain', methods=['POST'])
+def explain_suitability():
+    """Explain a suitability prediction with per-feature contributions"""
+    try:
+        data = request.json
+        
+        if forest is None:
+            return jsonify({
+                'error': 'Model not loaded. Please train the model first.'
+            }), 503
+        
+        data = apply_conditions([data])[0]
+        features = np.array([build_features(data)])
+        return jsonify(forest.explain_records(features)[0])
+        
+    except Exception as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+
+@app.route('/api/predict/suitability/explain/batch', methods=['POST'])
+def explain_suitability_batch():
+    """Explain several suitability predictions in one vectorized pass"""
+    try:
+        data = request.json
         
-        # Adjust based on predicted suitability
-        if not is_suitable:
-            base_duration = int(base_duration * 0.8)
+        if forest is None:
+            return jsonify({
+                'error': 'Model not loaded. Please train the model first.'
+            }), 503
+        
+        items = data.get('requests', [])
+        if not items:
+            return jsonify({
+                'error': 'No requests provided'
+            }), 400
+        
+        items = apply_conditions(items)
+        features = np.array([build_features(item) for item in items])
+        return jsonify({
+            'explanations': forest.explain_records(features)
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+
+@app.route('/api/conditions/<region>', methods=['GET'])
+def get_conditions(region):
+    """Cached hourly conditions for a region on a given day"""
+    try:
+        day = planned_start(request.args.get('date'), '00:00')
+        hourly = conditions.hourly(region, day)
+        
+        if not hourly:
+            return jsonify({
+                'error': f'No conditions available for {region}'
+            }), 404
         
         return jsonify({
-            'suitability_score': float(suitability_score),
-            'is_suitable': bool(is_suitable),
-            'recommended_duration_min': int(base_duration),
-            'best_time_window': best_time_window,
-            'confidence': float(np.clip(abs(suitability_score - 0.5) * 2, 0, 1))
+            'region': region,
+            'date': day.strftime('%Y-%m-%d'),
+            'hourly': hourly
         })
         
     except Exception as e:
@@ -174,6 +327,21 @@ def predict_duration():
             'error': str(e)
         }), 400
 
+def next_location(remaining, current_time, region, visit_date):
+    """Pop the next location to visit and its heat exposure at current_time
+
+    Keeps the requested order, except that a location in high heat at this
+    time is skipped in favour of the first one that is not.
+    """
+    start = planned_start(visit_date, f"{current_time // 60:02d}:{current_time % 60:02d}")
+    levels = conditions.heat_exposures(
+        [location.get('region', region) for location in remaining],
+        [start] * len(remaining),
+        [location.get('heat_exposure_level', 'medium') for location in remaining]
+    )
+    index = next((k for k, level in enumerate(levels) if level != 'high'), 0)
+    return remaining.pop(index), levels[index]
+
 @app.route('/api/optimize/itinerary', methods=['POST'])
 def optimize_itinerary():
     """Optimize itinerary with meal times and travel durations"""
@@ -186,6 +354,8 @@ def optimize_itinerary():
         include_breakfast = data.get('include_breakfast', True)
         include_lunch = data.get('include_lunch', True)
         include_dinner = data.get('include_dinner', True)
+        region = data.get('region')
+        visit_date = data.get('visit_date')
         
         if not locations:
             return jsonify({
@@ -206,9 +376,10 @@ def optimize_itinerary():
         
         # Optimize itinerary
         optimized_schedule = []
+        remaining = list(locations)
         current_time = start_total_min
         
-        for i, location in enumerate(locations):
+        for i in range(len(locations)):
             # Check if we need to add breakfast
             if include_breakfast and i == 0 and current_time < breakfast_time + 60:
                 optimized_schedule.append({
@@ -219,7 +390,8 @@ def optimize_itinerary():
                 })
                 current_time = breakfast_time + 30
             
-            # Add location
+            # Add location, deferring ones that would be in high heat now
+            location, heat_exposure_level = next_location(remaining, current_time, region, visit_date)
             duration = location.get('duration_min', 60)
             travel_time = 15 if i > 0 else 0  # Add travel time between locations
             
@@ -227,7 +399,8 @@ def optimize_itinerary():
                 'type': 'location',
                 'name': location.get('name', 'Unknown'),
                 'start_time': f"{current_time // 60:02d}:{current_time % 60:02d}",
-                'duration_min': duration
+                'duration_min': duration,
+                'heat_exposure_level': heat_exposure_level
             })
             current_time += duration + travel_time
             
@@ -262,5 +435,7 @@ def optimize_itinerary():
         }), 400
 
 if __name__ == '__main__':
+    # Warm the forecast cache in the background before serving
+    conditions.refresh(conditions.provider.regions())
     app.run(host='0.0.0.0', port=5000, debug=True)
 
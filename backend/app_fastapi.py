@@ -5,14 +5,17 @@ Handles ML predictions for itinerary planning using FastAPI
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import Dict, List, Optional
 import pandas as pd
 import joblib
 import numpy as np
 from datetime import datetime
 import os
 
+from conditions import ConditionsCache, FileConditionsProvider, OpenMeteoProvider, planned_start
+from forest_inference import DEFAULT_QUANTILES, ForestInference
+
 app = FastAPI(
     title="Ceylon Trails API",
     description="ML-powered itinerary planning API for Ceylon Trails",
@@ -45,12 +48,30 @@ else:
     location_encodings = {}
     print("Location encodings not found. Creating new encodings.")
 
+# Load feature names and precompute per-tree arrays for fast inference
+FEATURE_INFO_PATH = 'model/feature_info.pkl'
+if os.path.exists(FEATURE_INFO_PATH):
+    feature_info = joblib.load(FEATURE_INFO_PATH)
+else:
+    feature_info = {}
+    print(f"Feature info not found at {FEATURE_INFO_PATH}.")
+
+forest = ForestInference(model, feature_info.get('feature_names')) if model is not None else None
+
+# Shared forecast cache; a local forecast file replaces the live provider
+CONDITIONS_PATH = os.environ.get('CONDITIONS_PATH', 'data/conditions.json')
+if os.path.exists(CONDITIONS_PATH):
+    conditions = ConditionsCache(FileConditionsProvider(CONDITIONS_PATH))
+    print(f"Conditions loaded from {CONDITIONS_PATH}")
+else:
+    conditions = ConditionsCache(OpenMeteoProvider())
+
 # Pydantic models for request/response validation
 class HealthResponse(BaseModel):
     status: str
     model_loaded: bool
 
-class SuitabilityRequest(BaseModel):
+class SuitabilityItem(BaseModel):
     group_size: int = Field(default=1, ge=1)
     min_age: int = Field(default=30, ge=0)
     max_age: int = Field(default=50, ge=0)
@@ -67,13 +88,46 @@ class SuitabilityRequest(BaseModel):
     preferred_visit_start: str = Field(default="08:00")
     preferred_visit_end: str = Field(default="17:00")
     best_time_window: str = Field(default="Morning")
+    region: Optional[str] = None
+    visit_date: Optional[str] = None
+
+class SuitabilityRequest(SuitabilityItem):
+    quantiles: List[float] = Field(default=list(DEFAULT_QUANTILES))
 
 class SuitabilityResponse(BaseModel):
     suitability_score: float
     is_suitable: bool
     recommended_duration_min: int
     best_time_window: str
+    heat_exposure_level: str
     confidence: float
+    score_std: float
+    score_quantiles: Dict[str, float]
+
+class SuitabilityBatchRequest(BaseModel):
+    requests: List[SuitabilityItem]
+    quantiles: List[float] = Field(default=list(DEFAULT_QUANTILES))
+
+    @field_validator('requests', mode='before')
+    @classmethod
+    def reject_item_quantiles(cls, requests):
+        if any(isinstance(item, dict) and 'quantiles' in item for item in requests or []):
+            raise ValueError('quantiles must be set on the batch, not on individual requests')
+        return requests
+
+class SuitabilityBatchResponse(BaseModel):
+    predictions: List[SuitabilityResponse]
+
+class SuitabilityExplanation(BaseModel):
+    suitability_score: float
+    base_value: float
+    contributions: Dict[str, float]
+
+class SuitabilityExplainBatchRequest(BaseModel):
+    requests: List[SuitabilityItem]
+
+class SuitabilityExplainBatchResponse(BaseModel):
+    explanations: List[SuitabilityExplanation]
 
 class DurationRequest(BaseModel):
     location_type: str = Field(default="cultural")
@@ -88,6 +142,8 @@ class DurationResponse(BaseModel):
 class Location(BaseModel):
     name: str
     duration_min: int = Field(default=60)
+    region: Optional[str] = None
+    heat_exposure_level: str = Field(default="medium")
 
 class ItineraryRequest(BaseModel):
     locations: List[Location]
@@ -96,17 +152,101 @@ class ItineraryRequest(BaseModel):
     include_breakfast: bool = Field(default=True)
     include_lunch: bool = Field(default=True)
     include_dinner: bool = Field(default=True)
+    region: Optional[str] = None
+    visit_date: Optional[str] = None
 
 class ScheduleItem(BaseModel):
     type: str
     name: str
     start_time: str
     duration_min: int
+    heat_exposure_level: Optional[str] = None
+
+class HourlyConditions(BaseModel):
+    time: str
+    temperature_c: float
+    humidity_pct: float
+    heat_exposure_level: str
+
+class ConditionsResponse(BaseModel):
+    region: str
+    date: str
+    hourly: List[HourlyConditions]
 
 class ItineraryResponse(BaseModel):
     optimized_schedule: List[ScheduleItem]
     total_duration_min: int
 
+def build_features(request: SuitabilityItem) -> List[float]:
+    """Encode a suitability request into the model's feature vector"""
+    # Extract features from request
+    has_wheelchair_user = request.n_wheelchair_user > 0
+    
+    # Encode categorical features
+    terrain_encoded = {
+        'flat': 0, 'mild_elevation': 1, 'hilly': 2, 
+        'steep': 3, 'mixed': 4
+    }.get(request.terrain_level, 0)
+    
+    accessibility_encoded = {
+        'full': 0, 'partial': 1, 'limited': 2
+    }.get(request.accessibility, 0)
+    
+    heat_encoded = {
+        'low': 0, 'medium': 1, 'high': 2
+    }.get(request.heat_exposure_level, 1)
+    
+    location_type_encoded = {
+        'nature': 0, 'religious': 1, 'cultural': 2, 'shopping': 3
+    }.get(request.location_type, 2)
+    
+    time_window_encoded = {
+        'Morning': 0, 'Midday': 1, 'Afternoon': 2, 'Evening': 3
+    }.get(request.best_time_window, 1)
+    
+    # Parse time to cyclical encoding (sin/cos)
+    start_hour, start_min = map(int, request.preferred_visit_start.split(':'))
+    start_time_total_min = start_hour * 60 + start_min
+    start_time_sin = np.sin(2 * np.pi * start_time_total_min / 1440)
+    start_time_cos = np.cos(2 * np.pi * start_time_total_min / 1440)
+    
+    # Feature vector
+    return [
+        request.group_size,
+        request.min_age,
+        request.max_age,
+        request.n_fully_mobile,
+        request.n_assisted,
+        request.n_wheelchair_user,
+        request.n_limited_endurance,
+        request.n_child_carried,
+        1 if has_wheelchair_user else 0,
+        terrain_encoded,
+        accessibility_encoded,
+        heat_encoded,
+        location_type_encoded,
+        time_window_encoded,
+        start_time_sin,
+        start_time_cos,
+    ]
+
+def apply_conditions(requests: List[SuitabilityItem]) -> List[SuitabilityItem]:
+    """Derive heat exposure from forecast conditions at each planned start"""
+    levels = conditions.heat_exposures(
+        [item.region for item in requests],
+        [planned_start(item.visit_date, item.preferred_visit_start) for item in requests],
+        [item.heat_exposure_level for item in requests]
+    )
+    return [
+        item.model_copy(update={'heat_exposure_level': level})
+        for item, level in zip(requests, levels)
+    ]
+
+@app.on_event("startup")
+async def warm_conditions():
+    """Fetch forecasts for the known regions in the background"""
+    conditions.refresh(conditions.provider.regions())
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
@@ -115,96 +255,147 @@ async def health_check():
         'model_loaded': model is not None
     }
 
+def suitability_response(request: SuitabilityItem, prediction: dict) -> dict:
+    """Combine a forest prediction with the duration recommendation"""
+    has_wheelchair_user = request.n_wheelchair_user > 0
+    
+    # Calculate recommended duration
+    base_duration = 60
+    if request.terrain_level in ['hilly', 'steep']:
+        base_duration += 20
+    if request.location_type == 'cultural':
+        base_duration += 30
+    if request.group_size >= 5:
+        base_duration += 15
+    if has_wheelchair_user:
+        base_duration += 20
+    
+    if not prediction['is_suitable']:
+        base_duration = int(base_duration * 0.8)
+    
+    return {
+        'suitability_score': prediction['suitability_score'],
+        'is_suitable': prediction['is_suitable'],
+        'recommended_duration_min': int(base_duration),
+        'best_time_window': request.best_time_window,
+        'heat_exposure_level': request.heat_exposure_level,
+        'confidence': prediction['confidence'],
+        'score_std': prediction['score_std'],
+        'score_quantiles': prediction['score_quantiles']
+    }
+
+# Handlers that read the conditions cache are plain functions so FastAPI
+# runs them in its threadpool instead of on the event loop
 @app.post("/api/predict/suitability", response_model=SuitabilityResponse)
-async def predict_suitability(request: SuitabilityRequest):
+def predict_suitability(request: SuitabilityRequest):
     """Predict location suitability for a group"""
-    if model is None:
+    if forest is None:
         raise HTTPException(
             status_code=503,
             detail='Model not loaded. Please train the model first.'
         )
     
     try:
-        # Extract features from request
-        has_wheelchair_user = request.n_wheelchair_user > 0
-        
-        # Encode categorical features
-        terrain_encoded = {
-            'flat': 0, 'mild_elevation': 1, 'hilly': 2, 
-            'steep': 3, 'mixed': 4
-        }.get(request.terrain_level, 0)
-        
-        accessibility_encoded = {
-            'full': 0, 'partial': 1, 'limited': 2
-        }.get(request.accessibility, 0)
-        
-        heat_encoded = {
-            'low': 0, 'medium': 1, 'high': 2
-        }.get(request.heat_exposure_level, 1)
+        # Per-tree outputs give mean, spread and quantiles in one pass
+        request = apply_conditions([request])[0]
+        features = np.array([build_features(request)])
+        prediction = forest.predict_records(features, request.quantiles)[0]
+        return suitability_response(request, prediction)
         
-        location_type_encoded = {
-            'nature': 0, 'religious': 1, 'cultural': 2, 'shopping': 3
-        }.get(request.location_type, 2)
-        
-        time_window_encoded = {
-            'Morning': 0, 'Midday': 1, 'Afternoon': 2, 'Evening': 3
-        }.get(request.best_time_window, 1)
-        
-        # Parse time to cyclical encoding (sin/cos)
-        start_hour, start_min = map(int, request.preferred_visit_start.split(':'))
-        start_time_total_min = start_hour * 60 + start_min
-        start_time_sin = np.sin(2 * np.pi * start_time_total_min / 1440)
-        start_time_cos = np.cos(2 * np.pi * start_time_total_min / 1440)
-        
-        # Feature vector
-        features = np.array([[
-            request.group_size,
-            request.min_age,
-            request.max_age,
-            request.n_fully_mobile,
-            request.n_assisted,
-            request.n_wheelchair_user,
-            request.n_limited_endurance,
-            request.n_child_carried,
-            1 if has_wheelchair_user else 0,
-            terrain_encoded,
-            accessibility_encoded,
-            heat_encoded,
-            location_type_encoded,
-            time_window_encoded,
-            start_time_sin,
-            start_time_cos,
-        ]])
-        
-        # Get prediction
-        suitability_score = float(model.predict(features)[0])
-        is_suitable = suitability_score >= 0.5
-        
-        # Calculate recommended duration
-        base_duration = 60
-        if request.terrain_level in ['hilly', 'steep']:
-            base_duration += 20
-        if request.location_type == 'cultural':
-            base_duration += 30
-        if request.group_size >= 5:
-            base_duration += 15
-        if has_wheelchair_user:
-            base_duration += 20
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/predict/suitability/batch", response_model=SuitabilityBatchResponse)
+def predict_suitability_batch(request: SuitabilityBatchRequest):
+    """Predict suitability for several locations or groups at once"""
+    if forest is None:
+        raise HTTPException(
+            status_code=503,
+            detail='Model not loaded. Please train the model first.'
+        )
+    if not request.requests:
+        raise HTTPException(
+            status_code=400,
+            detail='No requests provided'
+        )
+    
+    try:
+        items = apply_conditions(request.requests)
+        features = np.array([build_features(item) for item in items])
+        predictions = forest.predict_records(features, request.quantiles)
+        return {
+            'predictions': [
+                suitability_response(item, prediction)
+                for item, prediction in zip(items, predictions)
+            ]
+        }
         
-        if not is_suitable:
-            base_duration = int(base_duration * 0.8)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/predict/suitability/explain", response_model=SuitabilityExplanation)
+def explain_suitability(request: SuitabilityItem):
+    """Explain a suitability prediction with per-feature contributions"""
+    if forest is None:
+        raise HTTPException(
+            status_code=503,
+            detail='Model not loaded. Please train the model first.'
+        )
+    
+    try:
+        request = apply_conditions([request])[0]
+        features = np.array([build_features(request)])
+        return forest.explain_records(features)[0]
         
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/predict/suitability/explain/batch", response_model=SuitabilityExplainBatchResponse)
+def explain_suitability_batch(request: SuitabilityExplainBatchRequest):
+    """Explain several suitability predictions in one vectorized pass"""
+    if forest is None:
+        raise HTTPException(
+            status_code=503,
+            detail='Model not loaded. Please train the model first.'
+        )
+    if not request.requests:
+        raise HTTPException(
+            status_code=400,
+            detail='No requests provided'
+        )
+    
+    try:
+        items = apply_conditions(request.requests)
+        features = np.array([build_features(item) for item in items])
         return {
-            'suitability_score': float(suitability_score),
-            'is_suitable': bool(is_suitable),
-            'recommended_duration_min': int(base_duration),
-            'best_time_window': request.best_time_window,
-            'confidence': float(np.clip(abs(suitability_score - 0.5) * 2, 0, 1))
+            'explanations': forest.explain_records(features)
         }
         
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/api/conditions/{region}", response_model=ConditionsResponse)
+def get_conditions(region: str, date: Optional[str] = None):
+    """Cached hourly conditions for a region on a given day"""
+    try:
+        day = planned_start(date, '00:00')
+        hourly = conditions.hourly(region, day)
+        
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not hourly:
+        raise HTTPException(
+            status_code=404,
+            detail=f'No conditions available for {region}'
+        )
+    
+    return {
+        'region': region,
+        'date': day.strftime('%Y-%m-%d'),
+        'hourly': hourly
+    }
+
 @app.post("/api/predict/duration", response_model=DurationResponse)
 async def predict_duration(request: DurationRequest):
     """Predict visit duration for a location"""
@@ -234,8 +425,24 @@ async def predict_duration(request: DurationRequest):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/api/optimize/itinerary", response_model=ItineraryResponse)
-async def optimize_itinerary(request: ItineraryRequest):
+def next_location(remaining: List[Location], current_time: int, region: Optional[str],
+                  visit_date: Optional[str]):
+    """Pop the next location to visit and its heat exposure at current_time
+
+    Keeps the requested order, except that a location in high heat at this
+    time is skipped in favour of the first one that is not.
+    """
+    start = planned_start(visit_date, f"{current_time // 60:02d}:{current_time % 60:02d}")
+    levels = conditions.heat_exposures(
+        [location.region or region for location in remaining],
+        [start] * len(remaining),
+        [location.heat_exposure_level for location in remaining]
+    )
+    index = next((k for k, level in enumerate(levels) if level != 'high'), 0)
+    return remaining.pop(index), levels[index]
+
+@app.post("/api/optimize/itinerary", response_model=ItineraryResponse, response_model_exclude_none=True)
+def optimize_itinerary(request: ItineraryRequest):
     """Optimize itinerary with meal times and travel durations"""
     try:
         if not request.locations:
@@ -258,9 +465,10 @@ async def optimize_itinerary(request: ItineraryRequest):
         
         # Optimize itinerary
         optimized_schedule = []
+        remaining = list(request.locations)
         current_time = start_total_min
         
-        for i, location in enumerate(request.locations):
+        for i in range(len(request.locations)):
             # Check if we need to add breakfast
             if request.include_breakfast and i == 0 and current_time < breakfast_time + 60:
                 optimized_schedule.append(ScheduleItem(
@@ -271,14 +479,18 @@ async def optimize_itinerary(request: ItineraryRequest):
                 ))
                 current_time = breakfast_time + 30
             
-            # Add location
+            # Add location, deferring ones that would be in high heat now
+            location, heat_exposure_level = next_location(
+                remaining, current_time, request.region, request.visit_date
+            )
             travel_time = 15 if i > 0 else 0  # Add travel time between locations
             
             optimized_schedule.append(ScheduleItem(
                 type='location',
                 name=location.name,
                 start_time=f"{current_time // 60:02d}:{current_time % 60:02d}",
-                duration_min=location.duration_min
+                duration_min=location.duration_min,
+                heat_exposure_level=heat_exposure_level
             ))
             current_time += location.duration_min + travel_time
             
@@ -0,0 +1,304 @@
+"""
+Server-side weather conditions cache
+Hourly forecasts per region are fetched from a pluggable provider, kept in
+compact time-indexed arrays and turned into heat exposure levels for the
+suitability model and the itinerary optimizer
+"""
+
+from datetime import datetime, timedelta
+import json
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+# Forecast hours are naive local times in the provider's time zone
+TIMEZONE = 'Asia/Colombo'
+
+HEAT_LEVELS = ('low', 'medium', 'high')
+
+# Apparent temperature (°C) boundaries between low/medium and medium/high,
+# taken from the NWS heat index bands ("extreme caution" from 32, "danger"
+# from 41). Ordinary lowland daytime here (28-32°C at 65-80% humidity) feels
+# like 33-38°C, so it stays in the medium band; cool mornings and the hill
+# country fall below it and hot, humid afternoons above it.
+HEAT_THRESHOLDS = (32.0, 41.0)
+
+# A site's own exposure (shade, open rock, ...) shifts the weather-driven
+# level, so in typical daytime weather every site keeps the label it was given
+SITE_OFFSETS = {'low': -1, 'medium': 0, 'high': 1}
+
+# Columns of the per-region forecast array
+TEMPERATURE = 0
+HUMIDITY = 1
+
+REGION_COORDINATES = {
+    'Colombo': (6.9271, 79.8612),
+    'Dambulla': (7.8731, 80.6511),
+    'Galle': (6.0535, 80.2210),
+    'Kandy': (7.2906, 80.6337),
+    'Sigiriya': (7.9570, 80.7603),
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def hour_index(when):
+    """Whole hours since the epoch for a naive local datetime"""
+    return int((when - _EPOCH) // timedelta(hours=1))
+
+
+def planned_start(visit_date, start_time):
+    """Combine an optional YYYY-MM-DD date with an HH:MM start time
+
+    Without a date the visit is today in the forecast time zone, whatever
+    the server's own zone is.
+    """
+    if visit_date:
+        day = datetime.strptime(visit_date, '%Y-%m-%d')
+    else:
+        day = datetime.now(ZoneInfo(TIMEZONE)).replace(tzinfo=None)
+    hour, minute = map(int, start_time.split(':'))
+    midnight = day.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight + timedelta(hours=hour, minutes=minute)
+
+
+def local_time(when):
+    """Naive local time in the forecast time zone"""
+    if when.tzinfo is not None:
+        when = when.astimezone(ZoneInfo(TIMEZONE)).replace(tzinfo=None)
+    return when
+
+
+def apparent_temperature(temperature_c, humidity_pct):
+    """Steadman apparent temperature without the wind term"""
+    temperature_c = np.asarray(temperature_c, dtype=np.float32)
+    vapour_pressure = (
+        np.asarray(humidity_pct, dtype=np.float32) / 100.0
+        * 6.105 * np.exp(17.27 * temperature_c / (237.7 + temperature_c))
+    )
+    return temperature_c + 0.33 * vapour_pressure - 4.0
+
+
+class FileConditionsProvider:
+    """Reads hourly forecasts from a local JSON file
+
+    The file maps region names to
+    {"start": "YYYY-MM-DDTHH:MM", "temperature_c": [...], "humidity_pct": [...]}
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._forecasts = {}
+        self._mtime = None
+
+    def _load(self):
+        """Parse the file once, and again only after it changes"""
+        mtime = os.path.getmtime(self.path)
+        if mtime != self._mtime:
+            with open(self.path) as f:
+                self._forecasts = json.load(f)
+            self._mtime = mtime
+        return self._forecasts
+
+    def regions(self):
+        return set(self._load())
+
+    def fetch(self, region):
+        forecast = self._load().get(region)
+        if forecast is None:
+            return None
+        start = local_time(datetime.fromisoformat(forecast['start']))
+        values = np.column_stack([
+            forecast['temperature_c'],
+            forecast['humidity_pct'],
+        ]).astype(np.float32)
+        return start, values
+
+
+class OpenMeteoProvider:
+    """Fetches hourly forecasts from Open-Meteo (no API key needed)"""
+
+    URL = 'https://api.open-meteo.com/v1/forecast'
+
+    def __init__(self, coordinates=None, timeout=5):
+        self.coordinates = coordinates or REGION_COORDINATES
+        self.timeout = timeout
+
+    def regions(self):
+        return set(self.coordinates)
+
+    def fetch(self, region):
+        if region not in self.coordinates:
+            return None
+        lat, lon = self.coordinates[region]
+        query = urllib.parse.urlencode({
+            'latitude': lat,
+            'longitude': lon,
+            'hourly': 'temperature_2m,relative_humidity_2m',
+            'timezone': TIMEZONE,
+        })
+        with urllib.request.urlopen(f'{self.URL}?{query}', timeout=self.timeout) as response:
+            hourly = json.load(response)['hourly']
+        start = local_time(datetime.fromisoformat(hourly['time'][0]))
+        values = np.column_stack([
+            hourly['temperature_2m'],
+            hourly['relative_humidity_2m'],
+        ]).astype(np.float32)
+        return start, values
+
+
+def _spawn(task):
+    threading.Thread(target=task, daemon=True).start()
+
+
+class ConditionsCache:
+    """Shared per-region forecast cache with refresh and expiry
+
+    Each region holds one (hours, 2) float32 array starting at a known hour,
+    so a lookup is an index computation rather than a provider call. Lookups
+    never wait on the provider: a missing or stale region is fetched in the
+    background (at most one fetch per region at a time) and callers use
+    whatever is cached meanwhile. Regions the provider does not know are
+    never fetched. Entries are refreshed after `ttl` seconds
+    and dropped after `max_age` seconds if the provider keeps failing; failed
+    fetches are retried after `retry_after`.
+    """
+
+    def __init__(self, provider, ttl=3600, max_age=6 * 3600, retry_after=300,
+                 clock=time.monotonic, spawn=_spawn):
+        self.provider = provider
+        self.ttl = ttl
+        self.max_age = max_age
+        self.retry_after = retry_after
+        self.clock = clock
+        self.spawn = spawn
+        self._entries = {}
+        self._retry_at = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def _refresh(self, region):
+        entry = None
+        try:
+            result = self.provider.fetch(region)
+            if result is not None:
+                start, values = result
+                entry = (hour_index(start), values)
+        except Exception as e:
+            print(f"Conditions refresh failed for {region}: {e}")
+        now = self.clock()
+        with self._lock:
+            self._in_flight.discard(region)
+            if entry is None:
+                self._retry_at[region] = now + self.retry_after
+                return
+            self._entries[region] = entry + (now,)
+            self._retry_at.pop(region, None)
+
+    def known(self, region):
+        """Whether the provider has forecasts for a region"""
+        try:
+            return region in self.provider.regions()
+        except Exception as e:
+            print(f"Conditions regions unavailable: {e}")
+            return False
+
+    def _schedule_refresh(self, region, now):
+        """Start a background fetch unless one is running or backing off"""
+        if region in self._in_flight or now < self._retry_at.get(region, 0):
+            return False
+        self._in_flight.add(region)
+        return True
+
+    def refresh(self, regions):
+        """Fetch the given regions in the background, e.g. at startup"""
+        regions = [region for region in regions if self.known(region)]
+        now = self.clock()
+        with self._lock:
+            scheduled = [region for region in regions if self._schedule_refresh(region, now)]
+        for region in scheduled:
+            self.spawn(lambda region=region: self._refresh(region))
+
+    def forecast(self, region):
+        """(start hour index, values) for a region, or None if not cached"""
+        if not self.known(region):
+            return None
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(region)
+            if entry is not None and now - entry[2] >= self.max_age:
+                del self._entries[region]
+                entry = None
+            stale = entry is None or now - entry[2] >= self.ttl
+            scheduled = stale and self._schedule_refresh(region, now)
+        if scheduled:
+            self.spawn(lambda: self._refresh(region))
+        if entry is None:
+            return None
+        return entry[0], entry[1]
+
+    def conditions_at(self, region, times):
+        """Hourly forecast rows for each time; NaN where not covered"""
+        hours = np.array([hour_index(when) for when in times], dtype=np.int64)
+        rows = np.full((len(hours), 2), np.nan, dtype=np.float32)
+        forecast = self.forecast(region)
+        if forecast is None:
+            return rows
+        start, values = forecast
+        offsets = hours - start
+        covered = (offsets >= 0) & (offsets < len(values))
+        rows[covered] = values[offsets[covered]]
+        return rows
+
+    def heat_exposures(self, regions, times, site_levels):
+        """Heat exposure level for each (region, planned start, site level)
+
+        Falls back to the site's own level when there is no region or no
+        forecast covering the planned start.
+        """
+        levels = list(site_levels)
+        by_region = {}
+        for i, region in enumerate(regions):
+            if region:
+                by_region.setdefault(region, []).append(i)
+
+        for region, indices in by_region.items():
+            rows = self.conditions_at(region, [times[i] for i in indices])
+            covered = ~np.isnan(rows[:, TEMPERATURE])
+            if not covered.any():
+                continue
+            feels_like = apparent_temperature(rows[covered, TEMPERATURE], rows[covered, HUMIDITY])
+            weather_level = np.digitize(feels_like, HEAT_THRESHOLDS)
+            offsets = np.array([
+                SITE_OFFSETS.get(levels[i], 0)
+                for i, is_covered in zip(indices, covered) if is_covered
+            ])
+            derived = np.clip(weather_level + offsets, 0, len(HEAT_LEVELS) - 1)
+            for i, level in zip(np.asarray(indices)[covered], derived):
+                levels[i] = HEAT_LEVELS[level]
+        return levels
+
+    def heat_exposure(self, region, when, site_level='medium'):
+        """Heat exposure level for a single location and planned start"""
+        return self.heat_exposures([region], [when], [site_level])[0]
+
+    def hourly(self, region, day):
+        """Hourly temperature, humidity and weather-driven heat level for a day"""
+        times = [day.replace(hour=h, minute=0, second=0, microsecond=0) for h in range(24)]
+        rows = self.conditions_at(region, times)
+        levels = self.heat_exposures([region] * 24, times, ['medium'] * 24)
+        return [
+            {
+                'time': when.strftime('%H:%M'),
+                'temperature_c': float(row[TEMPERATURE]),
+                'humidity_pct': float(row[HUMIDITY]),
+                'heat_exposure_level': level
+            }
+            for when, row, level in zip(times, rows, levels)
+            if not np.isnan(row[TEMPERATURE])
+        ]
@@ -0,0 +1,139 @@
+"""
+Vectorized inference over the trained Random Forest
+Precomputes per-tree node arrays at model load so that scoring, ensemble
+uncertainty and decision-path explanations for a batch run in a single
+traversal
+"""
+
+import numpy as np
+
+DEFAULT_QUANTILES = (0.1, 0.5, 0.9)
+# Training labels split unsuitable (<= 2.99) from suitable (>= 3.05) scores
+SUITABILITY_THRESHOLD = 3.0
+
+
+class ForestInference:
+    """Flattened view of a fitted RandomForestRegressor"""
+
+    def __init__(self, model, feature_names=None):
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        n_trees = len(trees)
+        max_nodes = max(tree.node_count for tree in trees)
+
+        self.n_trees = n_trees
+        self.n_features = int(model.n_features_in_)
+        self.max_depth = max(int(tree.max_depth) for tree in trees)
+        self.feature_names = list(feature_names or [f'feature_{i}' for i in range(self.n_features)])
+
+        # Padded (n_trees, max_nodes) arrays. Leaves point back to themselves
+        # with an infinite threshold, so a fixed number of steps always ends
+        # on a leaf and contributes nothing once it gets there.
+        self.feature = np.zeros((n_trees, max_nodes), dtype=np.intp)
+        self.threshold = np.full((n_trees, max_nodes), np.inf)
+        self.left = np.tile(np.arange(max_nodes, dtype=np.intp), (n_trees, 1))
+        self.right = self.left.copy()
+        self.value = np.zeros((n_trees, max_nodes))
+
+        for t, tree in enumerate(trees):
+            n = tree.node_count
+            is_split = tree.children_left[:n] != -1
+            nodes = np.arange(n)[is_split]
+            self.feature[t, nodes] = tree.feature[nodes]
+            self.threshold[t, nodes] = tree.threshold[nodes]
+            self.left[t, nodes] = tree.children_left[nodes]
+            self.right[t, nodes] = tree.children_right[nodes]
+            self.value[t, :n] = tree.value[:n, 0, 0]
+
+        self._tree_index = np.arange(n_trees)[None, :]
+        # Expected prediction before any split is taken
+        self.base_value = float(self.value[:, 0].mean())
+
+    def _traverse(self, X, explain=False):
+        """Walk every sample down every tree at once"""
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        n_samples = X.shape[0]
+        rows = np.arange(n_samples)[:, None]
+        trees = self._tree_index
+
+        node = np.zeros((n_samples, self.n_trees), dtype=np.intp)
+        contributions = np.zeros(n_samples * self.n_features) if explain else None
+        flat_offset = rows * self.n_features
+
+        for _ in range(self.max_depth):
+            feature = self.feature[trees, node]
+            go_left = X[rows, feature] <= self.threshold[trees, node]
+            child = np.where(go_left, self.left[trees, node], self.right[trees, node])
+            if explain:
+                delta = self.value[trees, child] - self.value[trees, node]
+                contributions += np.bincount(
+                    (flat_offset + feature).ravel(),
+                    weights=delta.ravel(),
+                    minlength=contributions.size
+                )
+            node = child
+
+        leaf_values = self.value[trees, node]
+        if explain:
+            contributions = contributions.reshape(n_samples, self.n_features) / self.n_trees
+        return leaf_values, contributions
+
+    def predict(self, X):
+        """Forest prediction for each row of X"""
+        leaf_values, _ = self._traverse(X)
+        return leaf_values.mean(axis=1)
+
+    def predict_distribution(self, X, quantiles=DEFAULT_QUANTILES):
+        """Mean, standard deviation, quantiles and raw values of the per-tree outputs"""
+        leaf_values, _ = self._traverse(X)
+        quantile_values = np.quantile(leaf_values, quantiles, axis=1).T
+        return leaf_values.mean(axis=1), leaf_values.std(axis=1), quantile_values, leaf_values
+
+    def predict_records(self, X, quantiles=DEFAULT_QUANTILES, threshold=SUITABILITY_THRESHOLD):
+        """Scores with ensemble uncertainty as JSON-friendly dicts
+
+        confidence is the share of trees that agree with the forest on
+        whether the score clears the suitability threshold.
+        """
+        means, stds, quantile_values, leaf_values = self.predict_distribution(X, quantiles)
+        is_suitable = means >= threshold
+        agreement = ((leaf_values >= threshold) == is_suitable[:, None]).mean(axis=1)
+        return [
+            {
+                'suitability_score': float(mean),
+                'is_suitable': bool(suitable),
+                'score_std': float(std),
+                'score_quantiles': {
+                    f'{q:g}': float(value)
+                    for q, value in zip(quantiles, row)
+                },
+                'confidence': float(confidence)
+            }
+            for mean, suitable, std, row, confidence
+            in zip(means, is_suitable, stds, quantile_values, agreement)
+        ]
+
+    def explain(self, X):
+        """Predictions and per-feature decision-path contributions
+
+        For every row, base_value + contributions.sum() equals the prediction.
+        """
+        leaf_values, contributions = self._traverse(X, explain=True)
+        return leaf_values.mean(axis=1), contributions
+
+    def explain_records(self, X):
+        """Explanations as JSON-friendly dicts keyed by feature name"""
+        predictions, contributions = self.explain(X)
+        return [
+            {
+                'suitability_score': float(prediction),
+                'base_value': self.base_value,
+                'contributions': {
+                    name: float(value)
+                    for name, value in zip(self.feature_names, row)
+                }
+            }
+            for prediction, row in zip(predictions, contributions)
+        ]
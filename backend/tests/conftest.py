@@ -0,0 +1,74 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+# The servers read forecasts from this file instead of Open-Meteo; it is hot
+# in Kandy from 11:00 to 15:00 on 2026-10-20
+CONDITIONS_PATH = os.path.join(TESTS_DIR, 'data', 'conditions.json')
+os.environ['CONDITIONS_PATH'] = CONDITIONS_PATH
+
+
+@pytest.fixture(scope='session')
+def conditions_path():
+    return CONDITIONS_PATH
+
+
+@pytest.fixture(scope='session')
+def model():
+    joblib = pytest.importorskip('joblib')
+    pytest.importorskip('sklearn')
+    return joblib.load(os.path.join(BACKEND_DIR, 'model', 'itinerary_model.pkl'))
+
+
+@pytest.fixture(scope='session')
+def forest(model):
+    from forest_inference import ForestInference
+    return ForestInference(model)
+
+
+@pytest.fixture(scope='session')
+def rows():
+    """Random rows spanning the ranges of the training features"""
+    rng = np.random.default_rng(0)
+    n = 200
+    minutes = rng.integers(0, 1440, n)
+    return np.column_stack([
+        rng.integers(1, 8, n),
+        rng.integers(0, 40, n),
+        rng.integers(40, 80, n),
+        rng.integers(0, 5, n),
+        rng.integers(0, 3, n),
+        rng.integers(0, 3, n),
+        rng.integers(0, 3, n),
+        rng.integers(0, 2, n),
+        rng.integers(0, 2, n),
+        rng.integers(0, 5, n),
+        rng.integers(0, 3, n),
+        rng.integers(0, 3, n),
+        rng.integers(0, 4, n),
+        rng.integers(0, 4, n),
+        np.sin(2 * np.pi * minutes / 1440),
+        np.cos(2 * np.pi * minutes / 1440),
+    ]).astype(float)
+
+
+@pytest.fixture(scope='session')
+def flask_app(model):
+    pytest.importorskip('flask')
+    os.chdir(BACKEND_DIR)
+    import app
+    return app
+
+
+@pytest.fixture(scope='session')
+def fastapi_app(model):
+    pytest.importorskip('fastapi')
+    os.chdir(BACKEND_DIR)
+    import app_fastapi
+    return app_fastapi
@@ -0,0 +1,96 @@
+import pytest
+
+
+@pytest.fixture
+def flask_client(flask_app):
+    return flask_app.app.test_client()
+
+
+@pytest.fixture
+def fastapi_client(fastapi_app):
+    from fastapi.testclient import TestClient
+    return TestClient(fastapi_app.app)
+
+
+def test_batch_rejects_per_request_quantiles(flask_client, fastapi_client):
+    body = {'requests': [{'terrain_level': 'hilly', 'quantiles': [0.25]}], 'quantiles': [0.5]}
+
+    assert flask_client.post('/api/predict/suitability/batch', json=body).status_code == 400
+    assert fastapi_client.post('/api/predict/suitability/batch', json=body).status_code == 422
+
+
+def test_batch_uses_batch_quantiles(flask_client, fastapi_client):
+    body = {'requests': [{'terrain_level': 'hilly'}, {}], 'quantiles': [0.25, 0.75]}
+
+    for response in (
+        flask_client.post('/api/predict/suitability/batch', json=body).json,
+        fastapi_client.post('/api/predict/suitability/batch', json=body).json(),
+    ):
+        assert [list(p['score_quantiles']) for p in response['predictions']] == [['0.25', '0.75']] * 2
+
+
+@pytest.fixture
+def hot_afternoon(flask_app, fastapi_app, conditions_path, monkeypatch):
+    """Fresh caches over the test forecast, already filled for Kandy"""
+    from conditions import ConditionsCache, FileConditionsProvider
+
+    for module in (flask_app, fastapi_app):
+        cache = ConditionsCache(FileConditionsProvider(conditions_path), spawn=lambda task: task())
+        cache.refresh(['Kandy'])
+        monkeypatch.setattr(module, 'conditions', cache)
+
+
+def test_region_derives_heat_exposure(hot_afternoon, flask_client, fastapi_client):
+    body = {
+        'region': 'Kandy',
+        'visit_date': '2026-10-20',
+        'heat_exposure_level': 'medium',
+        'preferred_visit_start': '12:00',
+    }
+
+    assert flask_client.post('/api/predict/suitability', json=body).json['heat_exposure_level'] == 'high'
+    assert fastapi_client.post('/api/predict/suitability', json=body).json()['heat_exposure_level'] == 'high'
+
+    without_region = dict(body, region=None)
+    assert fastapi_client.post('/api/predict/suitability', json=without_region).json()['heat_exposure_level'] == 'medium'
+
+
+def test_itinerary_defers_high_heat_locations(hot_afternoon, flask_client, fastapi_client):
+    body = {
+        'region': 'Kandy',
+        'visit_date': '2026-10-20',
+        'start_time': '11:00',
+        'include_breakfast': False,
+        'locations': [
+            {'name': 'Rock', 'duration_min': 60, 'heat_exposure_level': 'medium'},
+            {'name': 'Temple', 'duration_min': 60, 'heat_exposure_level': 'low'},
+        ],
+    }
+
+    for response in (
+        flask_client.post('/api/optimize/itinerary', json=body).json,
+        fastapi_client.post('/api/optimize/itinerary', json=body).json(),
+    ):
+        schedule = response['optimized_schedule']
+        assert [item['name'] for item in schedule] == ['Temple', 'Rock', 'Dinner']
+        assert schedule[0]['heat_exposure_level'] == 'medium'
+        assert 'heat_exposure_level' not in schedule[-1]
+
+
+def test_explain_contributions_add_up(flask_client, fastapi_client):
+    import joblib
+    feature_names = joblib.load('model/feature_info.pkl')['feature_names']
+    body = {'group_size': 3, 'n_wheelchair_user': 1, 'terrain_level': 'hilly', 'accessibility': 'partial'}
+
+    flask_single = flask_client.post('/api/predict/suitability/explain', json=body).json
+    flask_batch = flask_client.post('/api/predict/suitability/explain/batch', json={'requests': [body, {}]}).json
+    fastapi_single = fastapi_client.post('/api/predict/suitability/explain', json=body).json()
+    fastapi_batch = fastapi_client.post('/api/predict/suitability/explain/batch', json={'requests': [body, {}]}).json()
+
+    explanations = [flask_single, fastapi_single] + flask_batch['explanations'] + fastapi_batch['explanations']
+    assert len(explanations) == 6
+    for explanation in explanations:
+        assert sorted(explanation['contributions']) == sorted(feature_names)
+        assert len(feature_names) == 16
+        total = explanation['base_value'] + sum(explanation['contributions'].values())
+        assert total == pytest.approx(explanation['suitability_score'], abs=1e-9)
@@ -0,0 +1,197 @@
+import json
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from conditions import ConditionsCache, FileConditionsProvider, planned_start
+
+START = datetime(2026, 10, 20)
+
+
+class StubProvider:
+    """Returns a fixed 24-hour forecast for Kandy and records every fetch"""
+
+    def __init__(self, temperature=30.0, humidity=75.0):
+        self.start = START
+        self.values = np.full((24, 2), [temperature, humidity], dtype=np.float32)
+        self.calls = []
+        self.fail = False
+
+    def regions(self):
+        return {'Kandy'}
+
+    def fetch(self, region):
+        self.calls.append(region)
+        if self.fail:
+            raise IOError('provider down')
+        return self.start, self.values
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_cache(provider, clock):
+    return ConditionsCache(provider, ttl=100, max_age=300, retry_after=50, clock=clock, spawn=lambda task: task())
+
+
+def filled_cache(provider, clock):
+    cache = make_cache(provider, clock)
+    cache.refresh(['Kandy'])
+    return cache
+
+
+def test_ttl_refresh(clock):
+    provider = StubProvider()
+    cache = filled_cache(provider, clock)
+
+    assert cache.forecast('Kandy') is not None
+    clock.now = 99
+    cache.forecast('Kandy')
+    assert provider.calls == ['Kandy']
+
+    clock.now = 100
+    cache.forecast('Kandy')
+    assert provider.calls == ['Kandy', 'Kandy']
+
+
+def test_failed_refresh_waits_then_expires(clock):
+    provider = StubProvider()
+    cache = filled_cache(provider, clock)
+
+    provider.fail = True
+    clock.now = 100
+    assert cache.forecast('Kandy') is not None  # stale data is still served
+    clock.now = 149
+    cache.forecast('Kandy')
+    assert len(provider.calls) == 2  # waiting for retry_after
+
+    clock.now = 150
+    assert cache.forecast('Kandy') is not None
+    assert len(provider.calls) == 3
+
+    clock.now = 300
+    assert cache.forecast('Kandy') is None  # older than max_age
+
+
+def test_lookup_does_not_wait_for_fetch(clock):
+    provider = StubProvider()
+    pending = []
+    cache = ConditionsCache(provider, clock=clock, spawn=pending.append)
+
+    assert cache.forecast('Kandy') is None
+    assert cache.forecast('Kandy') is None
+    assert len(pending) == 1  # one fetch in flight per region
+
+    pending.pop()()
+    assert cache.forecast('Kandy') is not None
+
+
+def test_unknown_region_is_never_fetched(clock):
+    provider = StubProvider()
+    cache = make_cache(provider, clock)
+
+    assert cache.forecast('Nowhere') is None
+    cache.refresh(['Nowhere'])
+
+    assert provider.calls == []
+    assert cache._retry_at == {}
+
+
+def test_bad_payload_backs_off(clock):
+    provider = StubProvider()
+    provider.start = 'not a datetime'
+    cache = make_cache(provider, clock)
+
+    for _ in range(3):
+        assert cache.forecast('Kandy') is None
+
+    assert len(provider.calls) == 1
+    assert cache._retry_at == {'Kandy': 50}
+
+
+def test_forecast_window_edges(clock):
+    provider = StubProvider()
+    provider.values[:, 0] = np.arange(24)
+    cache = filled_cache(provider, clock)
+    times = [
+        datetime(2026, 10, 19, 23, 59),
+        datetime(2026, 10, 20, 0, 0),
+        datetime(2026, 10, 20, 23, 59),
+        datetime(2026, 10, 21, 0, 0),
+    ]
+
+    rows = cache.conditions_at('Kandy', times)
+
+    assert np.isnan(rows[0, 0])
+    assert rows[1, 0] == 0
+    assert rows[2, 0] == 23
+    assert np.isnan(rows[3, 0])
+
+
+@pytest.mark.parametrize('temperature, site_levels, expected', [
+    # Typical daytime weather keeps each site's own level
+    (30.0, ['low', 'medium', 'high'], ['low', 'medium', 'high']),
+    # Cool weather cannot go below low
+    (23.0, ['low', 'medium', 'high'], ['low', 'low', 'medium']),
+    # Hot, humid weather cannot go above high
+    (34.0, ['low', 'medium', 'high'], ['medium', 'high', 'high']),
+])
+def test_site_offsets_are_clipped(clock, temperature, site_levels, expected):
+    cache = filled_cache(StubProvider(temperature=temperature, humidity=75.0), clock)
+    when = datetime(2026, 10, 20, 12)
+
+    levels = cache.heat_exposures(['Kandy'] * 3, [when] * 3, site_levels)
+
+    assert levels == expected
+
+
+def test_typical_lowland_daytime_is_neutral(clock):
+    provider = StubProvider()
+    temperatures, humidities = np.meshgrid(np.linspace(28, 32, 5), np.linspace(65, 80, 4))
+    provider.values = np.column_stack([temperatures.ravel(), humidities.ravel()]).astype(np.float32)
+    cache = filled_cache(provider, clock)
+    times = [datetime(2026, 10, 20, hour) for hour in range(len(provider.values))]
+
+    levels = cache.heat_exposures(['Kandy'] * len(times), times, ['medium'] * len(times))
+
+    assert levels == ['medium'] * len(times)
+
+
+def test_missing_region_or_forecast_keeps_site_level(clock):
+    cache = filled_cache(StubProvider(temperature=34.0), clock)
+    outside = datetime(2026, 10, 25, 12)
+
+    levels = cache.heat_exposures([None, 'Kandy'], [START, outside], ['low', 'medium'])
+
+    assert levels == ['low', 'medium']
+
+
+def test_file_provider(tmp_path, clock):
+    path = tmp_path / 'conditions.json'
+    path.write_text(json.dumps({
+        'Kandy': {'start': '2026-10-19T18:30+00:00', 'temperature_c': [20, 21], 'humidity_pct': [80, 81]}
+    }))
+    provider = FileConditionsProvider(str(path))
+    cache = filled_cache(provider, clock)
+
+    # UTC start is read as midnight in Colombo
+    rows = cache.conditions_at('Kandy', [datetime(2026, 10, 20, 1, 30)])
+
+    np.testing.assert_array_equal(rows, [[21, 81]])
+    assert provider.regions() == {'Kandy'}
+    assert cache.forecast('Galle') is None
+
+
+def test_planned_start_rolls_past_midnight():
+    assert planned_start('2026-10-20', '25:15') == datetime(2026, 10, 21, 1, 15)
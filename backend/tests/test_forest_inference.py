@@ -0,0 +1,34 @@
+import numpy as np
+
+
+def test_predict_matches_sklearn(model, forest, rows):
+    np.testing.assert_allclose(forest.predict(rows), model.predict(rows), rtol=0, atol=1e-10)
+
+
+def test_per_tree_outputs_match_estimators(model, forest, rows):
+    leaf_values, _ = forest._traverse(rows)
+    for t, estimator in enumerate(model.estimators_):
+        np.testing.assert_allclose(leaf_values[:, t], estimator.predict(rows), rtol=0, atol=1e-10)
+
+
+def test_contributions_sum_to_prediction(forest, rows):
+    predictions, contributions = forest.explain(rows)
+    assert contributions.shape == (len(rows), forest.n_features)
+    np.testing.assert_allclose(forest.base_value + contributions.sum(axis=1), predictions, atol=1e-10)
+
+
+def test_predict_records_uncertainty(forest, rows):
+    quantiles = (0.05, 0.5, 0.95)
+    leaf_values, _ = forest._traverse(rows)
+    records = forest.predict_records(rows, quantiles)
+
+    np.testing.assert_allclose([r['score_std'] for r in records], np.std(leaf_values, axis=1))
+    expected_quantiles = np.quantile(leaf_values, quantiles, axis=1).T
+    for record, expected in zip(records, expected_quantiles):
+        assert list(record['score_quantiles']) == ['0.05', '0.5', '0.95']
+        np.testing.assert_allclose(list(record['score_quantiles'].values()), expected)
+
+    for record, trees in zip(records, leaf_values):
+        assert record['is_suitable'] == (trees.mean() >= 3.0)
+        same_side = (trees >= 3.0) == record['is_suitable']
+        assert record['confidence'] == same_side.mean()